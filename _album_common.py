@@ -0,0 +1,117 @@
+from __future__ import annotations
+from pathlib import Path
+import csv
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = Path(__file__).resolve().parent
+ALBUM_DIR = REPO_ROOT / "album"
+IMAGES_DIR = ALBUM_DIR / "images"
+CAPTIONS_CSV = ALBUM_DIR / "captions.csv"
+IMAGES_CACHE = ALBUM_DIR / ".images.cache.json"
+
+# str.endswith にそのまま渡せるよう tuple で持つ
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+# ディレクトリの mtime の分解能が粗いファイルシステムでは、直後の追加を取りこぼすことがある。
+# 更新直後のディレクトリはキャッシュしない
+CACHE_SETTLE_NS = 2_000_000_000
+
+def scan_images(images_dir: Path, cache_path: Path = IMAGES_CACHE) -> list[tuple[str, int]]:
+    """
+    images_dir の画像を (ファイル名, st_mtime_ns) のファイル名順の並びで返す
+    mtime は scandir の反復中に DirEntry.stat() で取る（後から Path.stat() し直さない）
+    ファイル名一覧は cache_path にも保存しておく（list_images 参照）
+    """
+    return _scan(images_dir, cache_path, images_dir.stat().st_mtime_ns, with_mtime=True)
+
+def _scan(images_dir: Path, cache_path: Path, dir_mtime_ns: int, with_mtime: bool) -> list[tuple[str, int]]:
+    # DirEntry.is_file() は readdir の結果を使うので、ファイルごとの stat が要らない
+    # （mtime が要るとき＝with_mtime のときだけ画像ごとに stat する。不要なら mtime は 0）
+    # 小文字化は 1 ファイル 1 回だけにして、拡張子判定とソートキーの両方に使う
+    # ファイル名は captions.csv 側（load_captions）と共有できるよう intern しておく
+    with os.scandir(images_dir) as it:
+        items = []
+        for entry in it:
+            key = entry.name.lower()
+            if key.endswith(IMAGE_SUFFIXES) and entry.is_file():
+                mtime_ns = entry.stat().st_mtime_ns if with_mtime else 0
+                items.append((key, sys.intern(entry.name), mtime_ns))
+    # ファイル名順（例：200307a, 200307b... が自然順になる）
+    items.sort()
+    images = [(name, mtime_ns) for _, name, mtime_ns in items]
+    save_images_cache(cache_path, images_dir, dir_mtime_ns, [name for name, _ in images])
+    return images
+
+def code_mtime_ns() -> int:
+    # IMAGE_SUFFIXES やスキャンの条件を変えたら保存済みの一覧を使わないよう、このファイルの mtime も控える
+    return Path(__file__).stat().st_mtime_ns
+
+def save_images_cache(cache_path: Path, images_dir: Path, dir_mtime_ns: int, files: list[str]) -> None:
+    if time.time_ns() - dir_mtime_ns <= CACHE_SETTLE_NS:
+        return
+    cache = {"dir": str(images_dir), "mtime_ns": dir_mtime_ns, "code_mtime_ns": code_mtime_ns(),
+             "images": files}
+    text = json.dumps(cache, ensure_ascii=False)
+    try:
+        # 中身が同じなら書き直さない
+        if cache_path.exists() and cache_path.read_text(encoding="utf-8") == text:
+            return
+        cache_path.write_text(text, encoding="utf-8")
+    except OSError:
+        pass
+
+def list_images(images_dir: Path, cache_path: Path = IMAGES_CACHE) -> list[str]:
+    """
+    images_dir の画像のファイル名一覧
+    images_dir の mtime が前回のスキャンから変わっていなければ、保存済みの一覧を返す
+    一覧だけが要るので、スキャンし直すときも画像ごとの stat はしない
+    （generate_album.py と sync_captions.py を続けて実行したときの二重スキャンを避ける）
+    """
+    dir_mtime_ns = images_dir.stat().st_mtime_ns
+    try:
+        cache = json.loads(cache_path.read_text(encoding="utf-8"))
+        if (cache["dir"] == str(images_dir) and cache["mtime_ns"] == dir_mtime_ns
+                and cache["code_mtime_ns"] == code_mtime_ns()):
+            return [sys.intern(name) for name in cache["images"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    return [name for name, _ in _scan(images_dir, cache_path, dir_mtime_ns, with_mtime=False)]
+
+def load_captions(csv_path: Path) -> dict[str, tuple[str, str]]:
+    """
+    captions.csv: filename,title,note
+    returns: { "200307a.jpg": ("title...", "note..."), ... }
+    """
+    captions: dict[str, tuple[str, str]] = {}
+    if not csv_path.exists():
+        return captions
+
+    # Excel で扱いやすい UTF-8 BOM を許容して読む
+    with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return captions
+        if "filename" not in header:
+            raise SystemExit(f"captions.csv のヘッダに filename 列が必要です: {csv_path}")
+        # title / note 列は無くてもよい（空として扱う）
+        i_fn = header.index("filename")
+        i_title = header.index("title") if "title" in header else None
+        i_note = header.index("note") if "note" in header else None
+        width = len(header)
+        for row in reader:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            fn = row[i_fn].strip()
+            if not fn:
+                continue
+            # スキャン側のファイル名と同じオブジェクトにして、辞書引き・比較を同一性判定で済ませる
+            fn = sys.intern(fn)
+            title = row[i_title].strip() if i_title is not None else ""
+            note = row[i_note].strip() if i_note is not None else ""
+            captions[fn] = (title, note)
+    return captions
@@ -1,150 +1,210 @@
 from __future__ import annotations
 from pathlib import Path
-import csv
-from datetime import datetime
+import filecmp
+import json
+import time
+
+import _album_common
+from _album_common import ALBUM_DIR, CAPTIONS_CSV, IMAGES_DIR, load_captions, scan_images
 
-REPO_ROOT = Path(__file__).resolve().parent
-ALBUM_DIR = REPO_ROOT / "album"
-IMAGES_DIR = ALBUM_DIR / "images"
-CAPTIONS_CSV = ALBUM_DIR / "captions.csv"
 OUT_HTML = ALBUM_DIR / "index.html"
+CSS_FILE = ALBUM_DIR / "album.css"
+STAMP_FILE = ALBUM_DIR / ".index.stamp"
+# 出力の組み立てやキャプションの読み方が変わったら作り直すよう、これらの mtime も見る
+CODE_FILES = (Path(__file__), Path(_album_common.__file__))
+# 生成物。外から書き換えられた（git checkout など）ときも作り直すよう、mtime と size を控えておく
+OUTPUT_FILES = (OUT_HTML, CSS_FILE)
 
-IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+def input_stamp(images: list[tuple[str, int]]) -> dict[str, int]:
+    """
+    入力ファイルの更新時刻一覧（ns） { "200307a.jpg": mtime_ns, ..., "captions.csv": mtime_ns }
+    画像の追加・削除・差し替え、captions.csv やスクリプト（CODE_FILES）の編集を検出するために使う
+    images: scan_images の結果（画像の mtime はスキャン時に取得済み）
+    """
+    stamp = dict(images)
+    stamp[CAPTIONS_CSV.name] = CAPTIONS_CSV.stat().st_mtime_ns if CAPTIONS_CSV.exists() else 0
+    for code in CODE_FILES:
+        stamp[code.name] = code.stat().st_mtime_ns
+    return stamp
 
-def load_captions(csv_path: Path) -> dict[str, dict[str, str]]:
+def output_stamp() -> dict[str, list[int]] | None:
     """
-    captions.csv: filename,title,note
-    returns: { "200307a.jpg": {"title": "...", "note": "..."} , ... }
+    生成物の { "index.html": [mtime_ns, size], ... }
+    どれかが無ければ None
+    """
+    stamp = {}
+    for out in OUTPUT_FILES:
+        try:
+            st = out.stat()
+        except OSError:
+            return None
+        stamp[out.name] = [st.st_mtime_ns, st.st_size]
+    return stamp
+
+def read_stamp(stamp_path: Path) -> dict | None:
     """
-    captions: dict[str, dict[str, str]] = {}
-    if not csv_path.exists():
-        return captions
-
-    with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            fn = (row.get("filename") or "").strip()
-            if not fn:
-                continue
-            captions[fn] = {
-                "title": (row.get("title") or "").strip(),
-                "note": (row.get("note") or "").strip(),
-            }
-    return captions
-
-def list_images(images_dir: Path) -> list[Path]:
-    files = [p for p in images_dir.iterdir() if p.is_file() and p.suffix.lower() in IMAGE_EXTS]
-    # ファイル名順（例：200307a, 200307b... が自然順になる）
-    files.sort(key=lambda p: p.name.lower())
-    return files
-
-def figure_block(filename: str, title: str, note: str) -> str:
-    # キャプションが未登録ならプレースホルダ（後で captions.csv を埋める）
-    title_html = title if title else "（キャプション未入力）"
-    note_html = note if note else ""
-    note_span = f'\n        <span class="cap-note">{escape_html(note_html)}</span>' if note_html else ""
-    return f"""\
+    前回生成時の { "inputs": input_stamp(...), "outputs": output_stamp() }
+    """
+    try:
+        stamp = json.loads(stamp_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return stamp if isinstance(stamp, dict) else None
+
+# 図版 1 枚分（% 書式）。各値はエスケープ済みのものを埋める
+FIGURE_TEMPLATE = """\
     <figure>
-      <a class="thumb" href="images/{escape_attr(filename)}">
-        <img src="images/{escape_attr(filename)}" alt="{escape_attr(Path(filename).stem)}" loading="lazy">
+      <a class="thumb" href="images/%(fn_attr)s">
+        <img src="images/%(fn_attr)s" alt="%(stem_attr)s" loading="lazy">
       </a>
       <figcaption>
-        <span class="cap-title">{escape_html(title_html)}</span>{note_span}
+        <span class="cap-title">%(title_html)s</span>%(note_block)s
       </figcaption>
     </figure>
 """
 
+NOTE_TEMPLATE = '\n        <span class="cap-note">%(note_html)s</span>'
+
+def figure_block(fn_attr: str, stem_attr: str, title_html: str, note_html: str) -> str:
+    # 引数はすべてエスケープ済み（title_html / note_html は load_captions_html 参照）
+    return FIGURE_TEMPLATE % {
+        "fn_attr": fn_attr,
+        "stem_attr": stem_attr,
+        "title_html": title_html,
+        "note_block": NOTE_TEMPLATE % {"note_html": note_html} if note_html else "",
+    }
+
+# キャプションが未登録ならプレースホルダ（後で captions.csv を埋める）。エスケープ済み
+NO_CAPTION_HTML = ("（キャプション未入力）", "")
+
+def load_captions_html(csv_path: Path) -> dict[str, tuple[str, str]]:
+    """
+    load_captions の (title, note) を読み込み時に一度だけ HTML エスケープしておく
+    空のタイトルはここでプレースホルダに置き換える
+    """
+    return {
+        fn: (escape_html(title) if title else NO_CAPTION_HTML[0], escape_html(note))
+        for fn, (title, note) in load_captions(csv_path).items()
+    }
+
+# 本文・属性値の両方に使う（html.escape(quote=True) と同じ置き換え）
+HTML_ESCAPES = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&#x27;",
+})
+
 def escape_html(s: str) -> str:
-    return (s.replace("&", "&amp;")
-             .replace("<", "&lt;")
-             .replace(">", "&gt;")
-             .replace('"', "&quot;"))
-
-def escape_attr(s: str) -> str:
-    # 属性用（最低限）
-    return escape_html(s).replace("'", "&#39;")
-
-def build_html(figures: str, generated_iso: str) -> str:
-    # lastModified は「閲覧者のブラウザで見たファイル更新日時」なので、
-    # 生成時刻も明示しておくのが実務上わかりやすいです。
-    return f"""<!doctype html>
+    # 1 回の走査で置き換える
+    return s.translate(HTML_ESCAPES)
+
+def write_if_changed(path: Path, text: str) -> bool:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    try:
+        tmp.write_text(text, encoding="utf-8")
+    except BaseException:
+        # 書きかけの一時ファイルを残さない
+        tmp.unlink(missing_ok=True)
+        raise
+    return replace_if_changed(tmp, path)
+
+def replace_if_changed(tmp: Path, path: Path) -> bool:
+    """
+    tmp の内容が path と違うときだけ置き換える（mtime を無駄に更新しない）
+    一時ファイル経由で置き換えるので、途中で落ちても壊れたファイルが残らない
+    returns: 置き換えたら True
+    """
+    if path.exists() and filecmp.cmp(tmp, path, shallow=False):
+        tmp.unlink()
+        return False
+    tmp.replace(path)
+    return True
+
+# ページの見た目。毎回 HTML に埋め込まず album.css として別ファイルにする
+# （HTML が小さくなり、ブラウザ側でもキャッシュされる）
+ALBUM_CSS = """\
+:root { --gap: 10px; --max: 1100px; }
+
+body {
+  margin: 0;
+  font-family: system-ui, -apple-system, "Hiragino Sans", "Noto Sans JP", sans-serif;
+  background: #fff;
+  color: #111;
+}
+
+header {
+  max-width: var(--max);
+  margin: 24px auto 8px;
+  padding: 0 16px;
+}
+h1 { font-size: 1.2rem; margin: 0; font-weight: 600; }
+p  { margin: 8px 0 0; font-size: 0.95rem; color: #444; }
+
+.grid {
+  max-width: var(--max);
+  margin: 0 auto 32px;
+  padding: 0 16px;
+  display: grid;
+  grid-template-columns: repeat(3, 1fr);
+  gap: var(--gap);
+}
+@media (max-width: 900px) { .grid { grid-template-columns: repeat(2, 1fr); } }
+@media (max-width: 520px) { .grid { grid-template-columns: 1fr; } }
+
+figure {
+  margin: 0;
+  border-radius: 12px;
+  overflow: hidden;
+  background: #f4f4f4;
+  box-shadow: 0 1px 3px rgba(0,0,0,.08);
+}
+
+a.thumb {
+  display: block;
+  text-decoration: none;
+  color: inherit;
+}
+
+img {
+  width: 100%;
+  aspect-ratio: 4 / 3;
+  object-fit: cover;
+  display: block;
+  transform: scale(1);
+  transition: transform .12s ease-in-out;
+}
+a.thumb:hover img { transform: scale(1.02); }
+
+figcaption {
+  padding: 8px 10px 10px;
+  font-size: 0.92rem;
+  line-height: 1.35;
+  background: #fff;
+  border-top: 1px solid rgba(0,0,0,.06);
+}
+
+.cap-title { font-weight: 600; display: block; }
+.cap-note  { color: #444; font-size: 0.9em; display: block; margin-top: 2px; }
+
+footer {
+  max-width: var(--max);
+  margin: 0 auto 40px;
+  padding: 0 16px;
+  color: #444;
+  font-size: 0.92rem;
+}
+"""
+
+# 図版（figure_block）の前後。HTML_HEAD はそのまま、HTML_TAIL は generated_iso を埋めて書き出す
+HTML_HEAD = """<!doctype html>
 <html lang="ja">
 <head>
   <meta charset="utf-8" />
   <meta name="viewport" content="width=device-width, initial-scale=1" />
   <title>アルバム</title>
-  <style>
-    :root {{ --gap: 10px; --max: 1100px; }}
-
-    body {{
-      margin: 0;
-      font-family: system-ui, -apple-system, "Hiragino Sans", "Noto Sans JP", sans-serif;
-      background: #fff;
-      color: #111;
-    }}
-
-    header {{
-      max-width: var(--max);
-      margin: 24px auto 8px;
-      padding: 0 16px;
-    }}
-    h1 {{ font-size: 1.2rem; margin: 0; font-weight: 600; }}
-    p  {{ margin: 8px 0 0; font-size: 0.95rem; color: #444; }}
-
-    .grid {{
-      max-width: var(--max);
-      margin: 0 auto 32px;
-      padding: 0 16px;
-      display: grid;
-      grid-template-columns: repeat(3, 1fr);
-      gap: var(--gap);
-    }}
-    @media (max-width: 900px) {{ .grid {{ grid-template-columns: repeat(2, 1fr); }} }}
-    @media (max-width: 520px) {{ .grid {{ grid-template-columns: 1fr; }} }}
-
-    figure {{
-      margin: 0;
-      border-radius: 12px;
-      overflow: hidden;
-      background: #f4f4f4;
-      box-shadow: 0 1px 3px rgba(0,0,0,.08);
-    }}
-
-    a.thumb {{
-      display: block;
-      text-decoration: none;
-      color: inherit;
-    }}
-
-    img {{
-      width: 100%;
-      aspect-ratio: 4 / 3;
-      object-fit: cover;
-      display: block;
-      transform: scale(1);
-      transition: transform .12s ease-in-out;
-    }}
-    a.thumb:hover img {{ transform: scale(1.02); }}
-
-    figcaption {{
-      padding: 8px 10px 10px;
-      font-size: 0.92rem;
-      line-height: 1.35;
-      background: #fff;
-      border-top: 1px solid rgba(0,0,0,.06);
-    }}
-
-    .cap-title {{ font-weight: 600; display: block; }}
-    .cap-note  {{ color: #444; font-size: 0.9em; display: block; margin-top: 2px; }}
-
-    footer {{
-      max-width: var(--max);
-      margin: 0 auto 40px;
-      padding: 0 16px;
-      color: #444;
-      font-size: 0.92rem;
-    }}
-  </style>
+  <link rel="stylesheet" href="album.css" />
 </head>
 
 <body>
@@ -154,12 +214,16 @@ def build_html(figures: str, generated_iso: str) -> str:
   </header>
 
   <main class="grid">
-{figures.rstrip()}
-  </main>
+"""
+
+# lastModified は「閲覧者のブラウザで見たファイル更新日時」なので、
+# 入力（画像・captions.csv）の更新日時も明示しておくのが実務上わかりやすいです。
+# 生成した時刻ではなく入力の更新日時なので、同じ入力からは同じ HTML になります。
+HTML_TAIL = """  </main>
 
   <footer>
     <hr>
-    生成日時：{generated_iso}<br>
+    データ更新日時：{generated_iso}<br>
     最終更新（ブラウザ計算）：<span id="last-updated"></span>
   </footer>
 
@@ -174,23 +238,60 @@ def build_html(figures: str, generated_iso: str) -> str:
 </html>
 """
 
+def write_html(path: Path, images: list[str], captions: dict[str, tuple[str, str]],
+               generated_iso: str) -> None:
+    # 文書全体を文字列として組み立てず、図版ごとにバッファ付きでファイルへ流し込む
+    with path.open("w", encoding="utf-8", buffering=1 << 16) as f:
+        f.write(HTML_HEAD)
+        write = f.write
+        for fn in images:
+            title_html, note_html = captions.get(fn, NO_CAPTION_HTML)
+            # alt は拡張子を除いたファイル名（Path(fn).stem と同じ結果を Path を作らずに得る）
+            stem = fn.rpartition(".")[0] or fn
+            write(figure_block(escape_html(fn), escape_html(stem), title_html, note_html))
+        f.write(HTML_TAIL.format(generated_iso=generated_iso))
+
 def main() -> None:
     if not IMAGES_DIR.exists():
         raise SystemExit(f"images ディレクトリが見つかりません: {IMAGES_DIR}")
 
-    captions = load_captions(CAPTIONS_CSV)
-    images = list_images(IMAGES_DIR)
-
-    blocks = []
-    for p in images:
-        cap = captions.get(p.name, {})
-        blocks.append(figure_block(p.name, cap.get("title", ""), cap.get("note", "")))
+    # 画像の一覧と mtime は 1 回のスキャンでまとめて取る
+    scanned = scan_images(IMAGES_DIR)
+    images = [fn for fn, _ in scanned]
+    stamp = input_stamp(scanned)
+    # 入力も生成物も前回生成時から変わっていなければ何もしない（captions.csv も読まない）
+    saved = read_stamp(STAMP_FILE)
+    outputs = output_stamp()
+    if (saved is not None and outputs is not None
+            and saved.get("inputs") == stamp and saved.get("outputs") == outputs):
+        print(f"[OK] up-to-date: {OUT_HTML}  ({len(images)} images)")
+        return
+    # captions.csv はスキャンと並行して読むこともできるが、上の早期終了（最も多い実行）では
+    # 読まずに済むよう、stamp の確認が済んでから読む
+    captions = load_captions_html(CAPTIONS_CSV)
 
-    generated_iso = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    html = build_html("".join(blocks), generated_iso)
+    # フッターの日時は画像と captions.csv の更新日時だけから決める（スクリプトの編集では変わらない）
+    data_mtime_ns = max([mtime_ns for _, mtime_ns in scanned] + [stamp[CAPTIONS_CSV.name]])
+    generated_iso = (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(data_mtime_ns / 1e9))
+                     if data_mtime_ns else "-")
 
-    OUT_HTML.write_text(html, encoding="utf-8")
-    print(f"[OK] generated: {OUT_HTML}  ({len(images)} images)")
+    css_changed = write_if_changed(CSS_FILE, ALBUM_CSS)
+    tmp = OUT_HTML.with_suffix(OUT_HTML.suffix + ".tmp")
+    try:
+        write_html(tmp, images, captions, generated_iso)
+    except BaseException:
+        # 書きかけの一時ファイルを残さない
+        tmp.unlink(missing_ok=True)
+        raise
+    changed = replace_if_changed(tmp, OUT_HTML)
+    saved = {"inputs": stamp, "outputs": output_stamp()}
+    STAMP_FILE.write_text(json.dumps(saved, ensure_ascii=False, sort_keys=True), encoding="utf-8")
+    if changed:
+        print(f"[OK] generated: {OUT_HTML}  ({len(images)} images)")
+    else:
+        print(f"[OK] unchanged: {OUT_HTML}  ({len(images)} images)")
+    if css_changed:
+        print(f"[OK] generated: {CSS_FILE}")
 
 if __name__ == "__main__":
     main()